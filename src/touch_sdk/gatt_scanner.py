@@ -53,6 +53,11 @@ class GattScanner:
         if not self._scanning:
             return
 
+        # The backend filters by service_uuids too, but not all of them guarantee
+        # it, so drop unrelated advertisements before doing any other work
+        if self.service_uuid not in advertisement_data.service_uuids:
+            return
+
         if device.address in self._addresses:
             return
         self._addresses.add(device.address)
@@ -64,10 +69,9 @@ class GattScanner:
             or advertisement_data.local_name
         )
 
-        if self.service_uuid in advertisement_data.service_uuids:
-            if self.name_filter is not None:
-                if self.name_filter.lower() not in name.lower():
-                    return
+        if self.name_filter is not None:
+            if self.name_filter.lower() not in name.lower():
+                return
 
-            logger.info(f"Found {name}")
-            await self.on_scan_result(device, name)
+        logger.info(f"Found {name}")
+        await self.on_scan_result(device, name)
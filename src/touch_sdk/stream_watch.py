@@ -1,7 +1,7 @@
 import base64
-from functools import partial
 import binascii
 import sys
+import signal
 import asyncio
 import asyncio_atexit
 
@@ -39,6 +39,10 @@ class StreamWatch:
         self._stop_event = None
         self._event_loop = None
         self._disable_input = disable_input
+        self._signal_handlers = {}
+
+        self._stdout = sys.stdout.buffer
+        self._flush_pending = False
 
     def start(self):
         """Blocking event loop that starts the Bluetooth scanner
@@ -64,20 +68,46 @@ class StreamWatch:
         self._event_loop = asyncio.get_running_loop()
         self._stop_event = asyncio.Event()
 
-        asyncio_atexit.register(self.stop)
+        try:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous_handler = signal.getsignal(signum)
+                self._event_loop.add_signal_handler(signum, self._on_signal)
+                self._signal_handlers[signum] = previous_handler
+        except (NotImplementedError, RuntimeError):
+            # Loop signal handlers are unavailable on Windows and outside the
+            # main thread
+            asyncio_atexit.register(self.stop)
 
-        await self._connector.start()
-        if not self._disable_input:
-            task1 = asyncio.create_task(self._input_loop())  # Wrap coroutines in tasks
-            task2 = asyncio.create_task(self._wait_and_stop())
-            _, pending = await asyncio.wait(
-                [task2, task1],
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-            for p in pending:
-                p.cancel()
-        else:
-            await self._wait_and_stop()
+        try:
+            await self._connector.start()
+            if not self._disable_input:
+                task1 = asyncio.create_task(self._input_loop())  # Wrap coroutines in tasks
+                task2 = asyncio.create_task(self._wait_and_stop())
+                _, pending = await asyncio.wait(
+                    [task2, task1],
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for p in pending:
+                    p.cancel()
+            else:
+                await self._wait_and_stop()
+        finally:
+            self._remove_signal_handlers()
+
+    def _on_signal(self):
+        # A second signal goes to the previous handlers, so a stop that hangs
+        # on disconnecting can still be interrupted
+        self._remove_signal_handlers()
+        self.stop()
+
+    def _remove_signal_handlers(self):
+        while self._signal_handlers:
+            signum, previous_handler = self._signal_handlers.popitem()
+            self._event_loop.remove_signal_handler(signum)
+            # None means the handler wasn't installed from Python; removing
+            # the loop handler then restores the default
+            if previous_handler is not None:
+                signal.signal(signum, previous_handler)
 
     async def _wait_and_stop(self):
         assert self._stop_event
@@ -106,15 +136,18 @@ class StreamWatch:
         except binascii.Error as e:
             logger.error("Decode err: %s", e)
 
-    @staticmethod
-    def _print_data(data):
-        sys.stdout.buffer.write(data)
-        sys.stdout.flush()
+    def _flush_output(self):
+        self._flush_pending = False
+        self._stdout.flush()
 
     async def _output(self, data):
         if self._stop_event and not self._stop_event.is_set():
-            data = base64.b64encode(data) + b"\n"
-            await asyncio.to_thread(partial(StreamWatch._print_data, data))
+            self._stdout.write(base64.b64encode(data) + b"\n")
+
+            # Flush once the messages queued up in this loop iteration are written
+            if not self._flush_pending:
+                self._flush_pending = True
+                self._event_loop.call_soon(self._flush_output)
 
     async def _on_protobuf(self, pf: Update):
         """Bit simpler to let connector parse and serialize protobuf again
@@ -123,7 +156,7 @@ class StreamWatch:
         logger.debug("_on_protobuf")
         await self._output(pf.SerializeToString())
 
-    async def _on_approved_connection(self, client):
+    async def _on_approved_connection(self, client, _message):
         logger.debug("_on_approved_connection")
         self._client = client
         await self._fetch_info(client)
@@ -145,7 +178,6 @@ class StreamWatch:
 
 def main():
     from argparse import ArgumentParser
-    import signal
 
     def rs(*_):
         raise KeyboardInterrupt()
@@ -1,27 +1,57 @@
 import re
 import struct
-from itertools import accumulate, chain, tee
+from functools import lru_cache
+from itertools import chain
 
 __doc__ = """Miscellaneous utilities."""
 
 
-def pairwise(iterable):
-    """Return successive overlapping pairs taken from the input iterable.
+_ENDIANNESS_TOKENS = "@<>=!"
+_ENDIANNESS_SPLIT = re.compile(f"(?=[{_ENDIANNESS_TOKENS}])")
 
-    Rougly equivalent to `itertools.pairwise` in Python >=3.10; implemented here
-    for Python >=3.8 compatibility.
+
+@lru_cache(maxsize=None)
+def compile_chained(format_string):
+    """
+    Compile a format string that may contain multiple endianness tokens
+    (see unpack_chained) into a tuple of (offset, struct.Struct) pairs,
+    one for each endianness section.
     """
-    # pairwise("ABCDEFG") --> AB BC CD DE EF FG
-    first, second = tee(iterable)
-    next(second, None)
-    return zip(first, second)
 
+    format_description = (
+        format_string if format_string[0] in _ENDIANNESS_TOKENS else "@" + format_string
+    )
+
+    # The split yields an empty string before the first endianness token
+    format_strings = _ENDIANNESS_SPLIT.split(format_description)[1:]
 
-def partial_async(func, *args, **kwargs):
-    """functools.partial, but for async functions"""
-    async def wrapped_async(*args_, **kwargs_):
-        return await func(*args, *args_, **kwargs, **kwargs_)
-    return wrapped_async
+    layout = []
+    offset = 0
+    for fmt in format_strings:
+        compiled = struct.Struct(fmt)
+        layout.append((offset, compiled))
+        offset += compiled.size
+
+    return tuple(layout)
+
+
+def unpack_compiled(layout, data):
+    """Unpack struct data with a layout returned by compile_chained.
+
+    If the layout has a single endianness section and data is long enough
+    for at least two records of it, every whole record is unpacked and the
+    values are concatenated. Otherwise only the first record is unpacked.
+    Bytes after the last whole record are ignored in both cases."""
+    if len(layout) == 1:
+        compiled = layout[0][1]
+        size = compiled.size
+        if size and len(data) >= 2 * size:
+            records = memoryview(data)[: len(data) // size * size]
+            return tuple(chain.from_iterable(compiled.iter_unpack(records)))
+
+    return tuple(
+        chain.from_iterable(compiled.unpack_from(data, offset) for offset, compiled in layout)
+    )
 
 
 def unpack_chained(format_string, data):
@@ -33,21 +63,9 @@ def unpack_chained(format_string, data):
     format string ">f<i", the first 4 bytes will be interpreted as a big-endian
     single-precision float, and the last 4 bytes will be interpreted as
     a little-endian 32-bit signed integer.
-    """
-
-    endianness_tokens = "@<>=!"
 
-    format_description = (
-        format_string if format_string[0] in endianness_tokens else "@" + format_string
-    )
-
-    format_strings = re.split(f"(?=[{endianness_tokens}])", format_description)
-
-    sizes = [struct.calcsize(fmt) for fmt in format_strings]
-    ranges = pairwise(accumulate(sizes))
-    data_pieces = [data[start:end] for start, end in ranges]
-
-    nested_content = [
-        struct.unpack(fmt, piece) for piece, fmt in zip(data_pieces, format_strings[1:])
-    ]
-    return tuple(chain(*nested_content))
+    A format string without endianness changes may describe a record that
+    data repeats: 24 bytes unpacked with ">3f" yield 6 values. See
+    unpack_compiled.
+    """
+    return unpack_compiled(compile_chained(format_string), data)
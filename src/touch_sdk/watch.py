@@ -1,11 +1,14 @@
-from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from math import sqrt
+from operator import attrgetter
 import asyncio
-from typing import Tuple, Optional
+import logging
+from typing import NamedTuple, Tuple, Optional
 import asyncio_atexit
 
 from touch_sdk.uuids import PROTOBUF_OUTPUT, PROTOBUF_INPUT
-from touch_sdk.utils import unpack_chained
+from touch_sdk.utils import compile_chained, unpack_compiled
 from touch_sdk.watch_connector import WatchConnector
 
 # pylint: disable=no-name-in-module
@@ -13,13 +16,23 @@ from touch_sdk.protobuf.common_pb2 import GestureType
 from touch_sdk.protobuf.watch_output_pb2 import Update, Gesture, TouchEvent
 from touch_sdk.protobuf.watch_input_pb2 import InputUpdate, HapticEvent
 
+logger = logging.getLogger(__file__)
+
 
 __doc__ = """Discovering Touch SDK compatible BLE devices and interfacing with them."""
 
+_PINCH_TAP = GestureType.PINCH_TAP
+_TOUCH_CALLBACKS = {
+    TouchEvent.TouchEventType.BEGIN: "on_touch_down",
+    TouchEvent.TouchEventType.END: "on_touch_up",
+    TouchEvent.TouchEventType.MOVE: "on_touch_move",
+    TouchEvent.TouchEventType.CANCEL: "on_touch_cancel",
+}
+_BACK_BUTTON_ID = 0
+
 
-@dataclass(frozen=True)
-class SensorFrame:
-    """A Frozen container class for values of all streamable Touch SDK sensors."""
+class SensorFrame(NamedTuple):
+    """An immutable container class for values of all streamable Touch SDK sensors."""
 
     acceleration: Tuple[float]
     gravity: Tuple[float]
@@ -38,16 +51,23 @@ class Hand(Enum):
     LEFT = 2
 
 
-def _protovec2_to_tuple(vec):
-    return (vec.x, vec.y)
-
+_HANDS = {hand.value: hand for hand in Hand}
 
-def _protovec3_to_tuple(vec):
-    return (vec.x, vec.y, vec.z)
+_protovec2_to_tuple = attrgetter("x", "y")
+_protovec3_to_tuple = attrgetter("x", "y", "z")
+_protoquat_to_tuple = attrgetter("x", "y", "z", "w")
 
 
-def _protoquat_to_tuple(vec):
-    return (vec.x, vec.y, vec.z, vec.w)
+@lru_cache(maxsize=128)
+def _haptics_bytes(intensity, length):
+    """Serialized haptics update, cached since apps tend to repeat the
+    same few haptic patterns."""
+    input_update = InputUpdate()
+    haptic_event = input_update.hapticEvent
+    haptic_event.type = HapticEvent.HapticType.ONESHOT
+    haptic_event.length = length
+    haptic_event.intensity = intensity
+    return input_update.SerializeToString()
 
 
 class Watch:
@@ -70,14 +90,43 @@ class Watch:
         self._stop_event = None
 
         self._event_loop = None
+        self._input_queue = None
 
         self.custom_data = None
         if hasattr(self.__class__, "custom_data"):
             self.custom_data = self.__class__.custom_data
 
+        self._custom_data_layouts = {}
+
         self._hand = Hand.NONE
         self._battery_percentage = -1
 
+        # Only the parts of an update that overridden callbacks consume are
+        # processed; the base class callbacks are no-ops
+        self._touch_handlers = {
+            event_type: getattr(self, callback_name)
+            for event_type, callback_name in _TOUCH_CALLBACKS.items()
+            if self._overrides(callback_name)
+        }
+
+        handlers = {"info": self._proto_on_info}
+        if self._overrides("on_tap"):
+            handlers["gestures"] = self._proto_on_gestures
+        if self._touch_handlers:
+            handlers["touchEvents"] = self._proto_on_touch_events
+        if self._overrides("on_back_button"):
+            handlers["buttonEvents"] = self._proto_on_button_events
+        if self._overrides("on_rotary"):
+            handlers["rotaryEvents"] = self._proto_on_rotary_events
+        if self._overrides("on_gesture_probability"):
+            handlers["probabilities"] = self._proto_on_probabilities
+        if self._overrides("on_pressure"):
+            handlers["pressure"] = self.on_pressure
+        self._update_handlers = handlers
+
+        self._emit_arm_direction = self._overrides("on_arm_direction_change")
+        self._emit_sensors = self._overrides("on_sensors") or self._emit_arm_direction
+
         self._screen_resolution = None
         self._haptics_available = False
 
@@ -87,6 +136,9 @@ class Watch:
         self._manufacturer = ""
         self._model_info = ""
 
+    def _overrides(self, callback_name):
+        return getattr(type(self), callback_name) is not getattr(Watch, callback_name)
+
     @property
     def hand(self) -> Hand:
         """Which hand the device is worn on."""
@@ -153,23 +205,37 @@ class Watch:
 
         self._event_loop = asyncio.get_running_loop()
         self._stop_event = asyncio.Event()
+        self._input_queue = asyncio.Queue()
 
         asyncio_atexit.register(self.stop)
 
+        input_writer = self._event_loop.create_task(self._write_input_queue())
+
         await self._connector.start()
         await self._stop_event.wait()
+        input_writer.cancel()
+        if dropped := self._input_queue.qsize():
+            logger.warning(f"Dropped {dropped} unsent writes to the watch on stop")
         await self._connector.stop()
 
-    async def _on_approved_connection(self, client):
+    async def _on_approved_connection(self, client, message):
         self._client = client
 
-        await self._fetch_info(client)
-        await self._subscribe_to_custom_characteristics(client)
+        # Info carried by the approving update is handled right after this,
+        # which makes reading it unnecessary
+        if message.HasField("info"):
+            await self._subscribe_to_custom_characteristics(client)
+            return
+
+        await asyncio.gather(
+            self._fetch_info(client),
+            self._subscribe_to_custom_characteristics(client),
+        )
 
     async def _fetch_info(self, client):
         data = await client.read_gatt_char(PROTOBUF_OUTPUT)
         update = Update()
-        update.ParseFromString(bytes(data))
+        update.ParseFromString(memoryview(data))
         if update.HasField("info"):
             self._proto_on_info(update.info)
 
@@ -179,50 +245,51 @@ class Watch:
         if self.custom_data is None:
             return
 
+        self._custom_data_layouts = {
+            uuid: compile_chained(format_string)
+            for uuid, format_string in self.custom_data.items()
+        }
+
         subscriptions = [
             client.start_notify(uuid, self._on_custom_data) for uuid in self.custom_data
         ]
         await asyncio.gather(*subscriptions)
 
     async def _on_custom_data(self, characteristic, data):
-        format_string = self.custom_data.get(characteristic.uuid)
+        layout = self._custom_data_layouts.get(characteristic.uuid)
 
-        if format_string is None:
+        if layout is None:
             return
 
-        content = unpack_chained(format_string, data)
+        content = unpack_compiled(layout, data)
 
         self.on_custom_data(characteristic.uuid, content)
 
     def on_custom_data(self, uuid: str, content: Tuple):
-        """Receive data from custom characteristics"""
+        """Receive data from custom characteristics
+
+        If the format string of the characteristic has no endianness changes
+        and the data holds several records of it, content has the values of
+        every whole record in order."""
 
     # Main protobuf characteristic
 
     async def _on_protobuf(self, message):
-
-        for entry in message.probabilities:
-            if entry.label == GestureType.PINCH_HOLD or entry.label == GestureType.PINCH_TAP:
-                self.on_gesture_probability(entry.probability)
-            elif entry.label == GestureType.NONE:
-                self.on_gesture_probability(1 - entry.probability)
-
-        self._proto_on_sensors(message.sensorFrames, message.unixTime)
-        self._proto_on_gestures(message.gestures)
-        self._proto_on_touch_events(message.touchEvents)
-        self._proto_on_button_events(message.buttonEvents)
-        self._proto_on_rotary_events(message.rotaryEvents)
-
-        if message.HasField("info"):
-            self._proto_on_info(message.info)
-
-        if message.pressure != 0.0:
-            self.on_pressure(message.pressure)
+        # ListFields only yields populated fields, so the usual sensor-only
+        # update skips the handlers of everything else
+        handlers = self._update_handlers
+        for field, value in message.ListFields():
+            if field.name == "sensorFrames":
+                if self._emit_sensors:
+                    self._proto_on_sensors(value, message.unixTime)
+            elif (handler := handlers.get(field.name)) is not None:
+                handler(value)
 
     # Sensor events
 
     def _proto_on_sensors(self, frames, timestamp):
         frame = frames[-1]
+
         sensor_frame = SensorFrame(
             acceleration=_protovec3_to_tuple(frame.acc),
             gravity=_protovec3_to_tuple(frame.grav),
@@ -232,34 +299,35 @@ class Watch:
                 _protovec3_to_tuple(frame.mag) if frame.HasField("mag") else None
             ),
             magnetic_field_calibration=(
-                _protovec3_to_tuple(frame.magCal)
-                if frame.HasField("magCal")
-                else None
+                _protovec3_to_tuple(frame.magCal) if frame.HasField("magCal") else None
             ),
             timestamp=timestamp,
         )
         self.on_sensors(sensor_frame)
-        self._on_arm_direction_change(sensor_frame)
+        if self._emit_arm_direction:
+            self._on_arm_direction_change(sensor_frame)
 
     def on_sensors(self, sensor_frame: SensorFrame):
         """Callback when accelerometer, gyroscope, gravity, orientation, and
         magnetic field are changed. Guaranteed to have values for everything but
-        magnetic field information in every update."""
+        magnetic field information in every update.
 
-    def _on_arm_direction_change(self, sensor_frame: SensorFrame):
-        def normalize(vector):
-            length = sum(x * x for x in vector) ** 0.5
-            return [x / length for x in vector]
+        If an update carries several sensor frames, only the latest one is
+        passed on."""
 
-        grav = normalize(sensor_frame.gravity)
+    def _on_arm_direction_change(self, sensor_frame: SensorFrame):
+        grav_x, grav_y, grav_z = sensor_frame.gravity
+        inv_length = 1.0 / sqrt(grav_x * grav_x + grav_y * grav_y + grav_z * grav_z)
+        grav_y *= inv_length
+        grav_z *= inv_length
 
         av_x = -sensor_frame.angular_velocity[2]  # right = +
         av_y = -sensor_frame.angular_velocity[1]  # down = +
 
         handedness_scale = -1 if self._hand == Hand.LEFT else 1
 
-        delta_x = av_x * grav[2] + av_y * grav[1]
-        delta_y = handedness_scale * (av_y * grav[2] - av_x * grav[1])
+        delta_x = av_x * grav_z + av_y * grav_y
+        delta_y = handedness_scale * (av_y * grav_z - av_x * grav_y)
 
         self.on_arm_direction_change(delta_x, delta_y)
 
@@ -272,8 +340,17 @@ class Watch:
     # Gestures
 
     def _proto_on_gestures(self, gestures):
-        if any(g.type == GestureType.PINCH_TAP for g in gestures):
-            self.on_tap()
+        for gesture in gestures:
+            if gesture.type == _PINCH_TAP:
+                self.on_tap()
+                break
+
+    def _proto_on_probabilities(self, probabilities):
+        for entry in probabilities:
+            if entry.label == GestureType.PINCH_HOLD or entry.label == GestureType.PINCH_TAP:
+                self.on_gesture_probability(entry.probability)
+            elif entry.label == GestureType.NONE:
+                self.on_gesture_probability(1 - entry.probability)
 
     def on_gesture_probability(self, prob: float):
         """Called when gesture probability is received."""
@@ -284,16 +361,10 @@ class Watch:
     # Touch screen
 
     def _proto_on_touch_events(self, touch_events):
+        handlers = self._touch_handlers
         for touch in touch_events:
-            coords = _protovec2_to_tuple(touch.coords[0])
-            if touch.eventType == TouchEvent.TouchEventType.BEGIN:
-                self.on_touch_down(*coords)
-            elif touch.eventType == TouchEvent.TouchEventType.END:
-                self.on_touch_up(*coords)
-            elif touch.eventType == TouchEvent.TouchEventType.MOVE:
-                self.on_touch_move(*coords)
-            elif touch.eventType == TouchEvent.TouchEventType.CANCEL:
-                self.on_touch_cancel(*coords)
+            if (handler := handlers.get(touch.eventType)) is not None:
+                handler(*_protovec2_to_tuple(touch.coords[0]))
 
     def on_touch_down(self, x: float, y: float):
         """Touch screen touch starts."""
@@ -310,8 +381,10 @@ class Watch:
     # Button
 
     def _proto_on_button_events(self, buttons):
-        if any(b.id == 0 for b in buttons):
-            self.on_back_button()
+        for button in buttons:
+            if button.id == _BACK_BUTTON_ID:
+                self.on_back_button()
+                break
 
     def on_back_button(self):
         """Back button of the watch is pressed and released.
@@ -332,7 +405,7 @@ class Watch:
     # Info
 
     def _proto_on_info(self, info):
-        self._hand = Hand(info.hand)
+        self._hand = _HANDS.get(info.hand, Hand.NONE)
 
         if battery_percentage := info.batteryPercentage:
             self._battery_percentage = battery_percentage
@@ -361,27 +434,38 @@ class Watch:
         """Trigger vibration haptics on the watch.
 
         intensity: between 0 and 1
-        duration_ms: between 0 and 5000"""
-        input_update = self._create_haptics_update(intensity, duration_ms)
-        self._write_input_characteristic(input_update.SerializeToString(), self._client)
-
-    @staticmethod
-    def _create_haptics_update(intensity, length):
-        clamped_intensity = min(max(intensity, 0.0), 1.0)
-        clamped_length = min(max(int(length), 0), 5000)
-        haptic_event = HapticEvent()
-        haptic_event.type = HapticEvent.HapticType.ONESHOT
-        haptic_event.length = clamped_length
-        haptic_event.intensity = clamped_intensity
-        input_update = InputUpdate()
-        input_update.hapticEvent.CopyFrom(haptic_event)
-        return input_update
+        duration_ms: between 0 and 5000
+
+        Safe to call from threads other than the one running the watch."""
+        clamped_intensity = (
+            0.0 if intensity < 0.0 else 1.0 if intensity > 1.0 else intensity
+        )
+        length = int(duration_ms)
+        clamped_length = 0 if length < 0 else 5000 if length > 5000 else length
+        data = _haptics_bytes(round(clamped_intensity, 2), clamped_length)
+        self._write_input_characteristic(data, self._client)
 
     def _write_input_characteristic(self, data, client):
-        if self._event_loop is not None:
-            self._event_loop.create_task(
-                self._async_write_input_characteristic(PROTOBUF_INPUT, data, client)
-            )
+        if self._input_queue is None:
+            return
+
+        # Enqueued through the loop from every thread, so that writes keep
+        # their call order also when the app triggers them from its own threads
+        self._event_loop.call_soon_threadsafe(
+            self._input_queue.put_nowait, (data, client)
+        )
+
+    async def _write_input_queue(self):
+        # Writes go out one at a time in call order, without a task per write
+        while True:
+            data, client = await self._input_queue.get()
+            try:
+                await self._async_write_input_characteristic(
+                    PROTOBUF_INPUT, data, client
+                )
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Keep the writer alive, or every later write would be lost
+                logger.exception("Writing to the watch failed")
 
     async def _async_write_input_characteristic(self, characteristic, data, client):
         if client:
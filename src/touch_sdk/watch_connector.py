@@ -5,8 +5,8 @@ import logging
 
 import bleak
 from bleak import BleakClient
+from google.protobuf.internal import api_implementation
 
-from touch_sdk.utils import partial_async
 from touch_sdk.uuids import PROTOBUF_OUTPUT, PROTOBUF_INPUT, INTERACTION_SERVICE
 from touch_sdk.gatt_scanner import GattScanner
 
@@ -16,9 +16,33 @@ from touch_sdk.protobuf.watch_input_pb2 import InputUpdate, ClientInfo
 
 logger = logging.getLogger(__file__)
 
+if api_implementation.Type() == "python":
+    logger.warning(
+        "Using the pure-Python protobuf runtime; parsing watch data will be slow. "
+        "Install a protobuf release with the upb backend (>=4.21)."
+    )
+
 
 __doc__ = """Discovering Touch SDK compatible BLE devices and interfacing with them."""
 
+_DISCONNECT = Update.Signal.DISCONNECT
+# Serialized form of an update that carries nothing but a disconnect signal
+_DISCONNECT_ONLY = Update(signals=[_DISCONNECT]).SerializeToString()
+
+
+def _serialize_client_info():
+    client_info = ClientInfo()
+    client_info.appName = sys.argv[0] if sys.argv else ""
+    client_info.deviceName = platform.node()
+    client_info.os = platform.system()
+    input_update = InputUpdate()
+    input_update.clientInfo.CopyFrom(client_info)
+    return input_update.SerializeToString()
+
+
+# Client info doesn't change during the process, so serialize it only once
+_CLIENT_INFO = _serialize_client_info()
+
 
 class WatchConnector:
     """Manages connections to watches.
@@ -57,7 +81,6 @@ class WatchConnector:
         """Asynchronous blocking event loop that starts the Bluetooth scanner and connection loop.
 
         Makes it possible to run multiple async event loops with e.g. asyncio.gather."""
-        await self._start_connection_monitor()
         await self._scanner.start()
 
     async def stop(self):
@@ -69,27 +92,8 @@ class WatchConnector:
         ]
         await asyncio.gather(*disconnect_tasks)
 
-    async def _start_connection_monitor(self):
-        loop = asyncio.get_running_loop()
-        task = loop.create_task(self._monitor_connections())
-        self._tasks.add(task)
-        task.add_done_callback(self._tasks.discard)
-
-    async def _monitor_connections(self):
-        while True:
-            # Make sure disconnect is called for all clients for which
-            # is_connected is False (because of a physical disconnect, for example)
-            disconnect_tasks = [
-                self._disconnect(address)
-                for address, client in self._clients.items()
-                if not client.is_connected
-            ]
-
-            await asyncio.gather(*disconnect_tasks)
-            await asyncio.sleep(2)
-
     async def _on_scan_result(self, device, name):
-        client = BleakClient(device)
+        client = BleakClient(device, disconnected_callback=self._on_client_disconnected)
         address = device.address
 
         try:
@@ -104,87 +108,103 @@ class WatchConnector:
 
         try:
             await client.start_notify(
-                PROTOBUF_OUTPUT, partial_async(self._on_protobuf, device, name)
+                PROTOBUF_OUTPUT, self._create_protobuf_callback(address, name)
             )
         except bleak.exc.BleakDBusError:
             # [org.bluez.Error.NotConnected] Not Connected
             #
             # Sometimes (~50%) Bleak thinks the client is connected even though
-            # BlueZ thinks it's not. We could try to reconnect, but that messes
-            # up with _monitor_connections. Easier to just give up and try again
-            # through the scanner, even though it adds a delay and a bit of
-            # noise to the console.
+            # BlueZ thinks it's not. We could try to reconnect, but it's easier
+            # to just give up and try again through the scanner, even though it
+            # adds a delay and a bit of noise to the console.
             logger.info("Connecting failed, trying again")
             await self._disconnect(address)
 
+    def _on_client_disconnected(self, client):
+        # Clean up after physical disconnects. Disconnects started by _disconnect
+        # have already removed the client from _clients by the time this is called.
+        if self._clients.get(client.address) is not client:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._disconnect(client.address))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
     async def _disconnect(self, address, resume=True):
-        if (client := self._clients.pop(address, None)) is not None:
+        await self._teardown_client(address, self._clients.pop(address, None))
+
+        if not self._approved_addresses and resume:
+            await self._scanner.start_scanning()
+
+    async def _teardown_client(self, address, client):
+        """Disconnect a client that has already been removed from _clients,
+        without touching the scanner state."""
+        if client is not None:
             await client.disconnect()
 
         self._approved_addresses.discard(address)
         self._scanner.forget_address(address)
 
-        if not self._approved_addresses and resume:
-            await self._scanner.start_scanning()
+    def _create_protobuf_callback(self, address, name):
+        # Bleak only passes the characteristic, which doesn't identify the device
+        async def on_protobuf(_, data):
+            await self._on_protobuf(address, name, data)
 
-    async def _on_protobuf(self, device, name, _, data):
-        message = Update()
-        message.ParseFromString(bytes(data))
+        return on_protobuf
 
+    async def _on_protobuf(self, address, name, data):
         # Watch sent a disconnect signal. Might be because the user pressed "no"
         # from the connection dialog on the watch (was not connected to begin with),
-        # or because the watch app is exiting / user pressed "forget devices"
-        if any(s == Update.Signal.DISCONNECT for s in message.signals):
-            await self._handle_disconnect_signal(device, name)
+        # or because the watch app is exiting / user pressed "forget devices".
+        # A bare disconnect signal is recognized without parsing.
+        if data == _DISCONNECT_ONLY:
+            await self._handle_disconnect_signal(address, name)
+            return
 
-        # Watch sent some other data, but no disconnect signal = watch accepted
-        # the connection
-        else:
-            await self._handle_approved_connection(device, name)
-            await self._on_message(message)
+        message = Update.FromString(memoryview(data))
 
-    async def _handle_approved_connection(self, device, name):
-        if device.address in self._approved_addresses:
+        if _DISCONNECT in message.signals:
+            await self._handle_disconnect_signal(address, name)
             return
-        self._approved_addresses.add(device.address)
 
-        if (client := self._clients.get(device.address)) is not None:
+        # Watch sent some other data, but no disconnect signal = watch accepted
+        # the connection. Only the first such update needs the approval handling.
+        if address not in self._approved_addresses:
+            await self._handle_approved_connection(address, name, message)
+
+        await self._on_message(message)
+
+    async def _handle_approved_connection(self, address, name, message):
+        # Added before the first await, so concurrent notifications see it
+        self._approved_addresses.add(address)
+
+        if (client := self._clients.get(address)) is not None:
             logger.info(f"Connection approved by {name}")
             await self._scanner.stop_scanning()
 
-            disconnect_tasks = [
-                self._disconnect(address)
-                for address in self._clients
-                if address != device.address
-            ]
-
-            await asyncio.gather(*disconnect_tasks)
+            # Scanning was just stopped, so drop the other clients directly
+            # instead of going through _disconnect and its scanner restart check
+            others = [other for other in self._clients if other != address]
+            await asyncio.gather(
+                *(self._teardown_client(other, self._clients.pop(other)) for other in others)
+            )
 
             try:
-                await self._on_approved_connection(client)
+                await self._on_approved_connection(client, message)
             except bleak.exc.BleakDBusError as _:
                 # Catches "Unlikely GATT error"
-                await self._disconnect(device.address)
+                await self._disconnect(address)
 
-    async def _handle_disconnect_signal(self, device, name):
+    async def _handle_disconnect_signal(self, address, name):
         logger.warning(f"Connection declined from {name}")
-        await self._disconnect(device.address)
+        await self._disconnect(address)
 
     async def _send_client_info(self, client):
         if client.address in self._informed_addresses:
             return
 
-        client_info = ClientInfo()
-        client_info.appName = sys.argv[0]
-        client_info.deviceName = platform.node()
-        client_info.os = platform.system()
-        input_update = InputUpdate()
-        input_update.clientInfo.CopyFrom(client_info)
-
         try:
-            await client.write_gatt_char(
-                PROTOBUF_INPUT, input_update.SerializeToString(), True
-            )
+            await client.write_gatt_char(PROTOBUF_INPUT, _CLIENT_INFO, True)
         except bleak.exc.BleakDBusError:
             # [org.bluez.Error.Failed] Operation failed with ATT error:
             # 0x01 (Invalid Handle)